@@ -8,19 +8,24 @@
 #
 from collections import defaultdict, namedtuple
 from ctypes import windll, wintypes
+import ctypes
 from shutil import copyfile, copyfileobj, rmtree, which
 import argparse
+import atexit
 import cProfile
 import codecs
 import concurrent.futures
 import contextlib
 import errno
+import functools
 import gzip
 import hashlib
+import heapq
 import json
 import multiprocessing
 import os
 import pickle
+import queue
 import re
 import subprocess
 import sys
@@ -35,6 +40,32 @@ HashAlgorithm = hashlib.md5
 
 OUTPUT_LOCK = threading.Lock()
 
+# orjson is a C implementation of JSON encoding/decoding which is
+# noticeably faster than the stdlib json module.
+# Fall back to json if it is not installed.
+try:
+    import orjson # pylint: disable=wrong-import-position
+
+    def jsonLoads(data):
+        return orjson.loads(data)
+
+    def jsonDumps(doc):
+        return orjson.dumps(doc, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+except ImportError:
+    def jsonLoads(data):
+        return json.loads(data)
+
+    def jsonDumps(doc):
+        return json.dumps(doc, sort_keys=True, indent=4).encode('utf-8')
+
+# zstandard compresses cached object files considerably faster than the
+# stdlib gzip module at a comparable ratio.
+# Fall back to gzip if it is not installed.
+try:
+    import zstandard # pylint: disable=wrong-import-position
+except ImportError:
+    zstandard = None
+
 # try to use os.scandir or scandir.scandir
 # fall back to os.listdir if not found
 # same for scandir.walk
@@ -44,10 +75,7 @@ try:
     LIST = scandir.scandir
 except ImportError:
     WALK = os.walk
-    try:
-        LIST = os.scandir # type: ignore # pylint: disable=no-name-in-module
-    except AttributeError:
-        LIST = os.listdir
+    LIST = os.scandir # type: ignore
 
 # The codec that is used by clcache to store compiler STDOUR and STDERR in
 # output.txt and stderr.txt.
@@ -75,7 +103,43 @@ ERROR_PIPE_BUSY = 231
 # `includeFiles`: list of paths to include files, which this source file uses
 # `includesContentsHash`: hash of the contents of the includeFiles
 # `objectHash`: hash of the object in cache
-ManifestEntry = namedtuple('ManifestEntry', ['includeFiles', 'includesContentHash', 'objectHash'])
+# A __slots__ class instead of a namedtuple: manifests may contain thousands
+# of entries, and slots make the instances smaller and attribute access a
+# plain offset load.
+class ManifestEntry:
+    __slots__ = ['includeFiles', 'includesContentHash', 'objectHash']
+
+    def __init__(self, includeFiles, includesContentHash, objectHash):
+        self.includeFiles = includeFiles
+        self.includesContentHash = includesContentHash
+        self.objectHash = objectHash
+
+    def _asdict(self):
+        # Keep the JSON layout produced by the namedtuple this class replaced.
+        return {'includeFiles': self.includeFiles,
+                'includesContentHash': self.includesContentHash,
+                'objectHash': self.objectHash}
+
+    # Keep the value semantics of the namedtuple this class replaced:
+    # entries read back from a manifest file must compare equal to the
+    # entries that were stored.
+    def __eq__(self, other):
+        return (isinstance(other, ManifestEntry)
+                and self.includeFiles == other.includeFiles
+                and self.includesContentHash == other.includesContentHash
+                and self.objectHash == other.objectHash)
+
+    def __hash__(self):
+        return hash((tuple(self.includeFiles), self.includesContentHash, self.objectHash))
+
+    # Slotted instances cannot be pickled with protocol 0, which pymemcache's
+    # serializer uses when manifests go to a memcached backend, unless the
+    # state is spelled out explicitly.
+    def __getstate__(self):
+        return self.includeFiles, self.includesContentHash, self.objectHash
+
+    def __setstate__(self, state):
+        self.includeFiles, self.includesContentHash, self.objectHash = state
 
 CompilerArtifacts = namedtuple('CompilerArtifacts', ['objectFilePath', 'stdout', 'stderr'])
 
@@ -86,26 +150,54 @@ def printBinary(stream, rawData):
 
 
 def basenameWithoutExtension(path):
-    basename = os.path.basename(path)
-    return os.path.splitext(basename)[0]
+    # Equivalent to os.path.splitext(os.path.basename(path))[0], but with a
+    # single scan over the string instead of two os.path calls and their
+    # intermediate allocations. Mirrors ntpath's rules: both separators are
+    # recognized, a bare drive prefix is stripped, and a basename consisting
+    # only of leading dots has no extension.
+    sepIndex = max(path.rfind('\\'), path.rfind('/')) + 1
+    if sepIndex == 0 and path[1:2] == ':':
+        sepIndex = 2
+    dotIndex = path.rfind('.')
+    if dotIndex > sepIndex and path[sepIndex:dotIndex].strip('.'):
+        return path[sepIndex:dotIndex]
+    return path[sepIndex:]
 
 
 def filesBeneath(baseDir):
-    for path, _, filenames in WALK(baseDir):
-        for filename in filenames:
-            yield os.path.join(path, filename)
+    # Iterative scandir based traversal. DirEntry.is_dir() reuses the
+    # information the directory enumeration already fetched, so this avoids
+    # the extra stat per entry that a WALK plus os.path.join pays, and
+    # entry.path is built by plain concatenation. Like WALK, missing or
+    # unreadable directories yield nothing and symlinked directories are
+    # not descended into.
+    directories = [baseDir]
+    while directories:
+        currentDir = directories.pop()
+        try:
+            entries = LIST(currentDir)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    directories.append(entry.path)
+            else:
+                yield entry.path
 
 
-def childDirectories(path, absolute=True):
-    supportsScandir = (LIST != os.listdir) # pylint: disable=comparison-with-callable
+def childDirectoryEntries(path):
+    # Yield the DirEntry objects themselves so that callers can reuse the
+    # stat information the directory enumeration already fetched, instead
+    # of issuing one extra stat syscall per child.
     for entry in LIST(path):
-        if supportsScandir:
-            if entry.is_dir():
-                yield entry.path if absolute else entry.name
-        else:
-            absPath = os.path.join(path, entry)
-            if os.path.isdir(absPath):
-                yield absPath if absolute else entry
+        if entry.is_dir():
+            yield entry
+
+
+def childDirectories(path, absolute=True):
+    for entry in childDirectoryEntries(path):
+        yield entry.path if absolute else entry.name
 
 
 def normalizeBaseDir(baseDir):
@@ -138,6 +230,10 @@ class CacheLockException(Exception):
     pass
 
 
+class CacheEntryUnreadableException(Exception):
+    pass
+
+
 class CompilerFailedException(Exception):
     def __init__(self, exitCode, msgErr, msgOut=""):
         super(CompilerFailedException, self).__init__(msgErr)
@@ -192,20 +288,28 @@ class ManifestSection:
         manifestPath = self.manifestPath(manifestHash)
         printTraceStatement("Writing manifest with manifestHash = {} to {}".format(manifestHash, manifestPath))
         ensureDirectoryExists(self.manifestSectionDir)
-        with atomic_write(manifestPath, overwrite=True) as outFile:
+        with atomic_write(manifestPath, overwrite=True, mode='wb') as outFile:
             # Converting namedtuple to JSON via OrderedDict preserves key names and keys order
             entries = [e._asdict() for e in manifest.entries()]
             jsonobject = {'entries': entries}
-            json.dump(jsonobject, outFile, sort_keys=True, indent=2)
+            outFile.write(jsonDumps(jsonobject))
 
     def getManifest(self, manifestHash):
         fileName = self.manifestPath(manifestHash)
         if not os.path.exists(fileName):
             return None
         try:
-            with open(fileName, 'r') as inFile:
-                doc = json.load(inFile)
-                return Manifest([ManifestEntry(e['includeFiles'], e['includesContentHash'], e['objectHash'])
+            with open(fileName, 'rb') as inFile:
+                doc = jsonLoads(inFile.read())
+                # The hash strings are compared against freshly computed
+                # hashes while scanning for a matching entry; interning them
+                # lets equal comparisons take the pointer-identity fast path.
+                # Include paths repeat heavily across entries (the same
+                # headers show up in every entry), so interning those
+                # deduplicates the string storage as well.
+                return Manifest([ManifestEntry([sys.intern(path) for path in e['includeFiles']],
+                                               sys.intern(e['includesContentHash']),
+                                               sys.intern(e['objectHash']))
                                  for e in doc['entries']])
         except IOError:
             return None
@@ -305,7 +409,17 @@ class ManifestRepository:
 
 class CacheLock:
     """ Implements a lock for the object cache which
-    can be used in 'with' statements. """
+    can be used in 'with' statements.
+
+    The lock is backed by a named Win32 mutex on purpose: statistics,
+    manifest sections and artifact sections are shared between concurrent
+    clcache processes of the same build, so a process-private primitive
+    such as a CRITICAL_SECTION cannot be used here even though it would be
+    cheaper to acquire. A shared-memory flag waited on via WaitOnAddress
+    would be cheaper still, but offers no equivalent of WAIT_ABANDONED:
+    a clcache process killed mid-update (e.g. a cancelled build) would
+    leave the flag set and stall every other process until its timeout.
+    The kernel releases an abandoned mutex automatically. """
     INFINITE = 0xFFFFFFFF
     WAIT_ABANDONED_CODE = 0x00000080
     WAIT_TIMEOUT_CODE = 0x00000102
@@ -314,6 +428,7 @@ class CacheLock:
         self._mutexName = 'Local\\' + mutexName
         self._mutex = None
         self._timeoutMs = timeoutMs
+        self._spinCount = int(os.environ.get('CLCACHE_LOCK_SPIN', 40))
 
     def createMutex(self):
         self._mutex = windll.kernel32.CreateMutexW(
@@ -335,6 +450,16 @@ class CacheLock:
     def acquire(self):
         if not self._mutex:
             self.createMutex()
+        # The critical sections guarded by this lock are usually short
+        # (statistics updates, manifest reads), so try a few zero-timeout
+        # waits with a thread yield in between before parking the thread in
+        # the blocking wait below.
+        for _ in range(self._spinCount):
+            result = windll.kernel32.WaitForSingleObject(
+                self._mutex, wintypes.INT(0))
+            if result in [0, self.WAIT_ABANDONED_CODE]:
+                return
+            windll.kernel32.SwitchToThread()
         result = windll.kernel32.WaitForSingleObject(
             self._mutex, wintypes.INT(self._timeoutMs))
         if result not in [0, self.WAIT_ABANDONED_CODE]:
@@ -352,11 +477,26 @@ class CacheLock:
     def release(self):
         windll.kernel32.ReleaseMutex(self._mutex)
 
+    # Mutex names may not contain colons or backslashes; replace both in a
+    # single pass over the path.
+    _lockNameSanitizer = str.maketrans({':': '-', '\\': '-'})
+
+    # One CacheLock instance per path, so that the mutex handle is created
+    # once per process and reused instead of being created and closed for
+    # every section or statistics access. Waiting on the same handle from
+    # several threads is fine; ownership is tracked per thread by Windows.
+    _locksByPath = {}
+
     @staticmethod
     def forPath(path):
-        timeoutMs = int(os.environ.get('CLCACHE_OBJECT_CACHE_TIMEOUT_MS', 10 * 1000))
-        lockName = path.replace(':', '-').replace('\\', '-')
-        return CacheLock(lockName, timeoutMs)
+        key = os.path.normcase(path)
+        lock = CacheLock._locksByPath.get(key)
+        if lock is None:
+            timeoutMs = int(os.environ.get('CLCACHE_OBJECT_CACHE_TIMEOUT_MS', 10 * 1000))
+            lockName = path.translate(CacheLock._lockNameSanitizer)
+            lock = CacheLock(lockName, timeoutMs)
+            CacheLock._locksByPath[key] = lock
+        return lock
 
 
 class CompilerArtifactsSection:
@@ -374,6 +514,21 @@ class CompilerArtifactsSection:
     def cacheEntries(self):
         return childDirectories(self.compilerArtifactsSectionDir, absolute=False)
 
+    def cacheEntriesWithStats(self):
+        for cachekey in self.cacheEntries():
+            try:
+                # DirEntry.stat() reuses the information collected while
+                # scanning the directory, saving one os.stat syscall per
+                # cached object.
+                objectStat = next(
+                    (entry.stat() for entry in LIST(self.cacheEntryDir(cachekey))
+                     if entry.name == CompilerArtifactsSection.OBJECT_FILE),
+                    None)
+                if objectStat is not None:
+                    yield cachekey, objectStat
+            except OSError:
+                pass
+
     def cachedObjectName(self, key):
         return os.path.join(self.cacheEntryDir(key), CompilerArtifactsSection.OBJECT_FILE)
 
@@ -427,27 +582,23 @@ class CompilerArtifactsRepository:
     def clean(self, maxCompilerArtifactsSize):
         objectInfos = []
         for section in self.sections():
-            for cachekey in section.cacheEntries():
-                try:
-                    objectStat = os.stat(section.cachedObjectName(cachekey))
-                    objectInfos.append((objectStat, cachekey))
-                except OSError:
-                    pass
-
-        objectInfos.sort(key=lambda t: t[0].st_atime)
+            for cachekey, objectStat in section.cacheEntriesWithStats():
+                objectInfos.append((objectStat.st_atime, objectStat.st_size, cachekey))
 
         # compute real current size to fix up the stored cacheSize
-        currentSizeObjects = sum(x[0].st_size for x in objectInfos)
+        currentSizeObjects = sum(size for _, size, _ in objectInfos)
 
-        removedItems = 0
-        for stat, cachekey in objectInfos:
+        # Eviction only needs the entries with the oldest access times, so
+        # pop them off a heap instead of fully sorting all entries.
+        heapq.heapify(objectInfos)
+        while objectInfos:
+            _, size, cachekey = heapq.heappop(objectInfos)
             self.removeEntry(cachekey)
-            removedItems += 1
-            currentSizeObjects -= stat.st_size
+            currentSizeObjects -= size
             if currentSizeObjects < maxCompilerArtifactsSize:
                 break
 
-        return len(objectInfos)-removedItems, currentSizeObjects
+        return len(objectInfos), currentSizeObjects
 
     @staticmethod
     def computeKeyDirect(manifestHash, includesContentHash):
@@ -472,31 +623,52 @@ class CompilerArtifactsRepository:
 
         h = HashAlgorithm()
         h.update(compilerHash.encode("UTF-8"))
-        h.update(' '.join(normalizedCmdLine).encode("UTF-8"))
+        # Feed the arguments into the hash one by one; this hashes the same
+        # bytes as ' '.join(normalizedCmdLine) without materializing the
+        # joined command line.
+        for i, arg in enumerate(normalizedCmdLine):
+            if i:
+                h.update(b' ')
+            h.update(arg.encode("UTF-8"))
         h.update(preprocessedSourceCode)
         return h.hexdigest()
 
+    # Arguments we strip from the command line when normalizing it:
+    #
+    # - All arguments which only influence the preprocessor; the
+    #   preprocessor's output is already included into the hash sum so we
+    #   don't have to care about these switches in the command line as well.
+    # - The switch for specifying the output file name; we don't want two
+    #   invocations which are identical except for the output file name to be
+    #   treated differently.
+    # - The switch for specifying the number of parallel compiler processes
+    #   to use (when specifying multiple source files on the command line).
+    #
+    # The prefixes are grouped by their first character so that checking an
+    # argument only requires matching against the few prefixes sharing that
+    # character instead of the whole list.
+    _argsToStrip = ("AI", "C", "E", "P", "FI", "u", "X",
+                    "FU", "D", "EP", "Fx", "U", "I",
+                    "Fo",
+                    "MP")
+    _argsToStripByFirstCharacter = defaultdict(tuple)
+    for _arg in _argsToStrip:
+        _argsToStripByFirstCharacter[_arg[0]] += (_arg,)
+    _argsToStripByFirstCharacter = dict(_argsToStripByFirstCharacter)
+    del _arg
+
     @staticmethod
     def _normalizedCommandLine(cmdline):
-        # Remove all arguments from the command line which only influence the
-        # preprocessor; the preprocessor's output is already included into the
-        # hash sum so we don't have to care about these switches in the
-        # command line as well.
-        argsToStrip = ("AI", "C", "E", "P", "FI", "u", "X",
-                       "FU", "D", "EP", "Fx", "U", "I")
-
-        # Also remove the switch for specifying the output file name; we don't
-        # want two invocations which are identical except for the output file
-        # name to be treated differently.
-        argsToStrip += ("Fo",)
-
-        # Also strip the switch for specifying the number of parallel compiler
-        # processes to use (when specifying multiple source files on the
-        # command line).
-        argsToStrip += ("MP",)
-
-        return [arg for arg in cmdline
-                if not (arg[0] in "/-" and arg[1:].startswith(argsToStrip))]
+        argsToStripByFirstCharacter = CompilerArtifactsRepository._argsToStripByFirstCharacter
+
+        def keepArgument(arg):
+            if arg[:1] not in "/-":
+                return True
+            rest = arg[1:]
+            prefixes = argsToStripByFirstCharacter.get(rest[:1])
+            return prefixes is None or not rest.startswith(prefixes)
+
+        return [arg for arg in cmdline if keepArgument(arg)]
 
 class CacheFileStrategy:
     def __init__(self, cacheDirectory=None):
@@ -642,13 +814,34 @@ class Cache:
 
 
 class PersistentJSONDict:
+    # Parsed file contents keyed by (fileName, st_mtime_ns, st_size) so that
+    # repeated loads of an unchanged file within one process skip the JSON
+    # parsing. A concurrent writer changes mtime or size, which misses here.
+    _parseCache = {}
+
     def __init__(self, fileName):
         self._dirty = False
         self._dict = {}
         self._fileName = fileName
+        self._loadedContent = None
+        cacheKey = None
         try:
-            with open(self._fileName, 'r') as f:
-                self._dict = json.load(f)
+            stat = os.stat(fileName)
+            cacheKey = (fileName, stat.st_mtime_ns, stat.st_size)
+            cached = PersistentJSONDict._parseCache.get(cacheKey)
+            if cached is not None:
+                cachedDict, self._loadedContent = cached
+                self._dict = dict(cachedDict)
+                return
+        except OSError:
+            pass
+        try:
+            with open(self._fileName, 'rb') as f:
+                content = f.read()
+            self._dict = jsonLoads(content)
+            self._loadedContent = content
+            if cacheKey is not None:
+                PersistentJSONDict._parseCache[cacheKey] = (dict(self._dict), content)
         except IOError:
             pass
         except ValueError:
@@ -656,13 +849,41 @@ class PersistentJSONDict:
 
     def save(self):
         if self._dirty:
-            with atomic_write(self._fileName, overwrite=True) as f:
-                json.dump(self._dict, f, sort_keys=True, indent=4)
+            content = jsonDumps(self._dict)
+            # The dirty flag is set by any __setitem__, including ones that
+            # end up reproducing the loaded document (counter deltas that
+            # cancel out, re-set values). Comparing the serialized bytes
+            # turns those saves into a memcmp instead of an fsync+rename.
+            if content == self._loadedContent:
+                return
+            if "CLCACHE_STATS_NOSYNC" in os.environ:
+                # atomic_write fsyncs the temporary file before renaming it,
+                # which can dominate the cost of saving a small document. The
+                # statistics are best-effort counters, so allow opting out of
+                # the durability guarantee: a crash then loses at most the
+                # last few counter bumps, never produces a broken file.
+                tempFileName = '{}.{}.tmp'.format(self._fileName, os.getpid())
+                with open(tempFileName, 'wb') as f:
+                    f.write(content)
+                os.replace(tempFileName, self._fileName)
+            else:
+                with atomic_write(self._fileName, overwrite=True, mode='wb') as f:
+                    f.write(content)
+            self._loadedContent = content
+            stat = os.stat(self._fileName)
+            PersistentJSONDict._parseCache[(self._fileName, stat.st_mtime_ns, stat.st_size)] = \
+                (dict(self._dict), content)
 
     def __setitem__(self, key, value):
         self._dict[key] = value
         self._dirty = True
 
+    def update(self, other):
+        # A single C-level dict merge instead of one __setitem__ per key.
+        if other:
+            self._dict.update(other)
+            self._dirty = True
+
     def __getitem__(self, key):
         return self._dict[key]
 
@@ -699,6 +920,11 @@ class Configuration:
 
 
 class Statistics:
+    # The counters are shared between concurrent clcache processes, and
+    # Python has no portable cross-process atomic increment (the
+    # Interlocked* family are compiler intrinsics rather than kernel32
+    # exports), so updates have to remain read-modify-write cycles on the
+    # JSON file under the statistics CacheLock.
     CALLS_WITH_INVALID_ARGUMENT = "CallsWithInvalidArgument"
     CALLS_WITHOUT_SOURCE_FILE = "CallsWithoutSourceFile"
     CALLS_WITH_MULTIPLE_SOURCE_FILES = "CallsWithMultipleSourceFiles"
@@ -733,123 +959,139 @@ class Statistics:
         CACHE_SIZE,
     }
 
+    _ZERO_RESET = {k: 0 for k in RESETTABLE_KEYS}
+    _ZERO_ALL = {k: 0 for k in RESETTABLE_KEYS | NON_RESETTABLE_KEYS}
+
     def __init__(self, statsFile):
         self._statsFile = statsFile
         self._stats = None
+        # Counter increments are accumulated here and only folded into the
+        # JSON document once, when the context is left. This keeps the
+        # register* methods cheap in-memory operations.
+        self._pending = defaultdict(int)
         self.lock = CacheLock.forPath(self._statsFile)
 
     def __enter__(self):
         self._stats = PersistentJSONDict(self._statsFile)
-        for k in Statistics.RESETTABLE_KEYS | Statistics.NON_RESETTABLE_KEYS:
-            if k not in self._stats:
-                self._stats[k] = 0
+        missing = {k: 0 for k in Statistics._ZERO_ALL if k not in self._stats}
+        self._stats.update(missing)
         return self
 
     def __exit__(self, typ, value, traceback):
+        for key, delta in self._pending.items():
+            if delta:
+                self._stats[key] += delta
+        self._pending.clear()
         # Does not write to disc when unchanged
         self._stats.save()
 
     def __eq__(self, other):
         return type(self) is type(other) and self.__dict__ == other.__dict__
 
+    def _value(self, key):
+        return self._stats[key] + self._pending[key]
+
     def numCallsWithInvalidArgument(self):
-        return self._stats[Statistics.CALLS_WITH_INVALID_ARGUMENT]
+        return self._value(Statistics.CALLS_WITH_INVALID_ARGUMENT)
 
     def registerCallWithInvalidArgument(self):
-        self._stats[Statistics.CALLS_WITH_INVALID_ARGUMENT] += 1
+        self._pending[Statistics.CALLS_WITH_INVALID_ARGUMENT] += 1
 
     def numCallsWithoutSourceFile(self):
-        return self._stats[Statistics.CALLS_WITHOUT_SOURCE_FILE]
+        return self._value(Statistics.CALLS_WITHOUT_SOURCE_FILE)
 
     def registerCallWithoutSourceFile(self):
-        self._stats[Statistics.CALLS_WITHOUT_SOURCE_FILE] += 1
+        self._pending[Statistics.CALLS_WITHOUT_SOURCE_FILE] += 1
 
     def numCallsWithMultipleSourceFiles(self):
-        return self._stats[Statistics.CALLS_WITH_MULTIPLE_SOURCE_FILES]
+        return self._value(Statistics.CALLS_WITH_MULTIPLE_SOURCE_FILES)
 
     def registerCallWithMultipleSourceFiles(self):
-        self._stats[Statistics.CALLS_WITH_MULTIPLE_SOURCE_FILES] += 1
+        self._pending[Statistics.CALLS_WITH_MULTIPLE_SOURCE_FILES] += 1
 
     def numCallsWithPch(self):
-        return self._stats[Statistics.CALLS_WITH_PCH]
+        return self._value(Statistics.CALLS_WITH_PCH)
 
     def registerCallWithPch(self):
-        self._stats[Statistics.CALLS_WITH_PCH] += 1
+        self._pending[Statistics.CALLS_WITH_PCH] += 1
 
     def numCallsForLinking(self):
-        return self._stats[Statistics.CALLS_FOR_LINKING]
+        return self._value(Statistics.CALLS_FOR_LINKING)
 
     def registerCallForLinking(self):
-        self._stats[Statistics.CALLS_FOR_LINKING] += 1
+        self._pending[Statistics.CALLS_FOR_LINKING] += 1
 
     def numCallsForExternalDebugInfo(self):
-        return self._stats[Statistics.CALLS_FOR_EXTERNAL_DEBUG_INFO]
+        return self._value(Statistics.CALLS_FOR_EXTERNAL_DEBUG_INFO)
 
     def registerCallForExternalDebugInfo(self):
-        self._stats[Statistics.CALLS_FOR_EXTERNAL_DEBUG_INFO] += 1
+        self._pending[Statistics.CALLS_FOR_EXTERNAL_DEBUG_INFO] += 1
 
     def numEvictedMisses(self):
-        return self._stats[Statistics.EVICTED_MISSES]
+        return self._value(Statistics.EVICTED_MISSES)
 
     def registerEvictedMiss(self):
         self.registerCacheMiss()
-        self._stats[Statistics.EVICTED_MISSES] += 1
+        self._pending[Statistics.EVICTED_MISSES] += 1
 
     def numHeaderChangedMisses(self):
-        return self._stats[Statistics.HEADER_CHANGED_MISSES]
+        return self._value(Statistics.HEADER_CHANGED_MISSES)
 
     def registerHeaderChangedMiss(self):
         self.registerCacheMiss()
-        self._stats[Statistics.HEADER_CHANGED_MISSES] += 1
+        self._pending[Statistics.HEADER_CHANGED_MISSES] += 1
 
     def numSourceChangedMisses(self):
-        return self._stats[Statistics.SOURCE_CHANGED_MISSES]
+        return self._value(Statistics.SOURCE_CHANGED_MISSES)
 
     def registerSourceChangedMiss(self):
         self.registerCacheMiss()
-        self._stats[Statistics.SOURCE_CHANGED_MISSES] += 1
+        self._pending[Statistics.SOURCE_CHANGED_MISSES] += 1
 
     def numCacheEntries(self):
-        return self._stats[Statistics.CACHE_ENTRIES]
+        return self._value(Statistics.CACHE_ENTRIES)
 
     def setNumCacheEntries(self, number):
+        self._pending.pop(Statistics.CACHE_ENTRIES, None)
         self._stats[Statistics.CACHE_ENTRIES] = number
 
     def registerCacheEntry(self, size):
-        self._stats[Statistics.CACHE_ENTRIES] += 1
-        self._stats[Statistics.CACHE_SIZE] += size
+        self._pending[Statistics.CACHE_ENTRIES] += 1
+        self._pending[Statistics.CACHE_SIZE] += size
 
     def unregisterCacheEntry(self, size):
-        self._stats[Statistics.CACHE_ENTRIES] -= 1
-        self._stats[Statistics.CACHE_SIZE] -= size
+        self._pending[Statistics.CACHE_ENTRIES] -= 1
+        self._pending[Statistics.CACHE_SIZE] -= size
 
     def currentCacheSize(self):
-        return self._stats[Statistics.CACHE_SIZE]
+        return self._value(Statistics.CACHE_SIZE)
 
     def setCacheSize(self, size):
+        self._pending.pop(Statistics.CACHE_SIZE, None)
         self._stats[Statistics.CACHE_SIZE] = size
 
     def numCacheHits(self):
-        return self._stats[Statistics.CACHE_HITS]
+        return self._value(Statistics.CACHE_HITS)
 
     def registerCacheHit(self):
-        self._stats[Statistics.CACHE_HITS] += 1
+        self._pending[Statistics.CACHE_HITS] += 1
 
     def numCacheMisses(self):
-        return self._stats[Statistics.CACHE_MISSES]
+        return self._value(Statistics.CACHE_MISSES)
 
     def registerCacheMiss(self):
-        self._stats[Statistics.CACHE_MISSES] += 1
+        self._pending[Statistics.CACHE_MISSES] += 1
 
     def numCallsForPreprocessing(self):
-        return self._stats[Statistics.CALLS_FOR_PREPROCESSING]
+        return self._value(Statistics.CALLS_FOR_PREPROCESSING)
 
     def registerCallForPreprocessing(self):
-        self._stats[Statistics.CALLS_FOR_PREPROCESSING] += 1
+        self._pending[Statistics.CALLS_FOR_PREPROCESSING] += 1
 
     def resetCounters(self):
         for k in Statistics.RESETTABLE_KEYS:
-            self._stats[k] = 0
+            self._pending.pop(k, None)
+        self._stats.update(Statistics._ZERO_RESET)
 
 
 class AnalysisError(Exception):
@@ -884,8 +1126,19 @@ class InvalidArgumentError(AnalysisError):
     pass
 
 
+# Compiler hashes computed so far in this process, keyed on the path and the
+# stat information of the compiler binary. The same cl.exe is hashed for
+# every source file of a build, but its stat information virtually never
+# changes while we run.
+COMPILER_HASH_CACHE = {}
+
+
 def getCompilerHash(compilerBinary):
     stat = os.stat(compilerBinary)
+    key = (compilerBinary, stat.st_mtime_ns, stat.st_size)
+    cachedHash = COMPILER_HASH_CACHE.get(key)
+    if cachedHash is not None:
+        return cachedHash
     data = '|'.join([
         str(stat.st_mtime),
         str(stat.st_size),
@@ -893,7 +1146,8 @@ def getCompilerHash(compilerBinary):
         ])
     hasher = HashAlgorithm()
     hasher.update(data.encode("UTF-8"))
-    return hasher.hexdigest()
+    COMPILER_HASH_CACHE[key] = hasher.hexdigest()
+    return COMPILER_HASH_CACHE[key]
 
 
 def getFileHashes(filePaths):
@@ -914,6 +1168,13 @@ def getFileHashes(filePaths):
                 else:
                     raise
     else:
+        # Hashing the includes of a big translation unit is dominated by the
+        # latency of opening and reading many small files; a thread pool
+        # overlaps that IO (read() and hashlib release the GIL). For short
+        # lists the pool setup costs more than it saves, so hash inline.
+        if len(filePaths) > 16:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+                return list(executor.map(getFileHash, filePaths))
         return [getFileHash(filePath) for filePath in filePaths]
 
 
@@ -966,10 +1227,90 @@ def ensureDirectoryExists(path):
             raise
 
 
+FSCTL_DUPLICATE_EXTENTS_TO_FILE = 0x00098344
+GENERIC_READ = 0x80000000
+GENERIC_WRITE = 0x40000000
+FILE_SHARE_READ = 0x00000001
+OPEN_EXISTING = 3
+CREATE_ALWAYS = 2
+INVALID_HANDLE_VALUE = -1
+ERROR_NOT_SUPPORTED = 50
+ERROR_INVALID_FUNCTION = 1
+
+
+class DUPLICATE_EXTENTS_DATA(ctypes.Structure): # pylint: disable=invalid-name
+    _fields_ = [
+        ("FileHandle", wintypes.HANDLE),
+        ("SourceFileOffset", ctypes.c_longlong),
+        ("TargetFileOffset", ctypes.c_longlong),
+        ("ByteCount", ctypes.c_longlong),
+    ]
+
+
+# Block cloning is only available on ReFS volumes. Remember when the volume
+# reported it as unsupported so that we don't issue a doomed DeviceIoControl
+# call per cached file.
+BLOCK_CLONE_SUPPORTED = True
+
+
+def tryBlockClone(srcFilePath, dstFilePath):
+    # Clone the extents of srcFilePath into dstFilePath via
+    # FSCTL_DUPLICATE_EXTENTS_TO_FILE. On ReFS this is a constant-time
+    # metadata operation with copy-on-write semantics, regardless of the
+    # file size. Returns True on success.
+    global BLOCK_CLONE_SUPPORTED # pylint: disable=global-statement
+    if not BLOCK_CLONE_SUPPORTED:
+        return False
+
+    srcHandle = windll.kernel32.CreateFileW(str(srcFilePath), wintypes.DWORD(GENERIC_READ),
+                                            wintypes.DWORD(FILE_SHARE_READ), None,
+                                            wintypes.DWORD(OPEN_EXISTING), wintypes.DWORD(0), None)
+    if srcHandle == INVALID_HANDLE_VALUE:
+        return False
+    dstHandle = windll.kernel32.CreateFileW(str(dstFilePath), wintypes.DWORD(GENERIC_READ | GENERIC_WRITE),
+                                            wintypes.DWORD(0), None,
+                                            wintypes.DWORD(CREATE_ALWAYS), wintypes.DWORD(0), None)
+    if dstHandle == INVALID_HANDLE_VALUE:
+        windll.kernel32.CloseHandle(srcHandle)
+        return False
+
+    try:
+        # The destination must be at least as large as the cloned region.
+        fileSize = os.path.getsize(srcFilePath)
+        if not windll.kernel32.SetFilePointerEx(dstHandle, ctypes.c_longlong(fileSize), None, wintypes.DWORD(0)):
+            return False
+        if not windll.kernel32.SetEndOfFile(dstHandle):
+            return False
+
+        # The cloned region has to cover whole clusters; rounding the byte
+        # count up past the end of the file is explicitly allowed. 64KB is a
+        # multiple of every cluster size ReFS supports.
+        data = DUPLICATE_EXTENTS_DATA(srcHandle, 0, 0, (fileSize + 0xFFFF) & ~0xFFFF)
+        bytesReturned = wintypes.DWORD(0)
+        ret = windll.kernel32.DeviceIoControl(dstHandle, wintypes.DWORD(FSCTL_DUPLICATE_EXTENTS_TO_FILE),
+                                              ctypes.byref(data), wintypes.DWORD(ctypes.sizeof(data)),
+                                              None, wintypes.DWORD(0), ctypes.byref(bytesReturned), None)
+        if ret == 0:
+            if windll.kernel32.GetLastError() in [ERROR_NOT_SUPPORTED, ERROR_INVALID_FUNCTION]:
+                BLOCK_CLONE_SUPPORTED = False
+            return False
+        return True
+    finally:
+        windll.kernel32.CloseHandle(srcHandle)
+        windll.kernel32.CloseHandle(dstHandle)
+
+
+# Like CLCACHE_LOG, the CLCACHE_HARDLINK flag is fixed for the lifetime of
+# the process; snapshot it to keep the env lookup off the per-file path.
+# CLCACHE_COMPRESS and CLCACHE_COMPRESSLEVEL stay dynamic because the unit
+# tests toggle them at runtime.
+_hardlinkEnabled = "CLCACHE_HARDLINK" in os.environ
+
+
 def copyOrLink(srcFilePath, dstFilePath, writeCache=False):
     ensureDirectoryExists(os.path.dirname(os.path.abspath(dstFilePath)))
 
-    if "CLCACHE_HARDLINK" in os.environ:
+    if _hardlinkEnabled:
         ret = windll.kernel32.CreateHardLinkW(str(dstFilePath), str(srcFilePath), None)
         if ret != 0:
             # Touch the time stamp of the new link so that the build system
@@ -987,19 +1328,50 @@ def copyOrLink(srcFilePath, dstFilePath, writeCache=False):
     tempDst = dstFilePath + '.tmp'
 
     if "CLCACHE_COMPRESS" in os.environ:
-        if "CLCACHE_COMPRESSLEVEL" in os.environ:
-            compress = int(os.environ["CLCACHE_COMPRESSLEVEL"])
-        else:
-            compress = 6
-
         if writeCache is True:
-            with open(srcFilePath, 'rb') as fileIn, gzip.open(tempDst, 'wb', compress) as fileOut:
-                copyfileobj(fileIn, fileOut)
+            if zstandard is not None:
+                compress = int(os.environ.get("CLCACHE_COMPRESSLEVEL", 3))
+                with open(srcFilePath, 'rb') as fileIn, open(tempDst, 'wb') as fileOut:
+                    zstandard.ZstdCompressor(level=compress).copy_stream(fileIn, fileOut)
+            else:
+                compress = int(os.environ.get("CLCACHE_COMPRESSLEVEL", 6))
+                with open(srcFilePath, 'rb') as fileIn, gzip.open(tempDst, 'wb', compress) as fileOut:
+                    copyfileobj(fileIn, fileOut)
         else:
-            with gzip.open(srcFilePath, 'rb', compress) as fileIn, open(tempDst, 'wb') as fileOut:
-                copyfileobj(fileIn, fileOut)
-    else:
-        copyfile(srcFilePath, tempDst)
+            # Cache entries may have been written with either compressor, e.g.
+            # when zstandard was installed after the cache was populated or
+            # when the cache is shared with a clcache that has it installed,
+            # so dispatch on the frame magic when reading. An entry this
+            # process cannot decompress is reported as unreadable so that the
+            # callers can fall back to the real compiler instead of crashing.
+            with open(srcFilePath, 'rb') as fileIn, open(tempDst, 'wb') as fileOut:
+                magic = fileIn.read(4)
+                fileIn.seek(0)
+                if magic == b'\x28\xb5\x2f\xfd':
+                    if zstandard is None:
+                        raise CacheEntryUnreadableException(
+                            "cached object {} is zstandard-compressed but the zstandard "
+                            "module is not installed".format(srcFilePath))
+                    try:
+                        zstandard.ZstdDecompressor().copy_stream(fileIn, fileOut)
+                    except zstandard.ZstdError as e:
+                        raise CacheEntryUnreadableException(
+                            "cached object {} could not be decompressed: {}".format(srcFilePath, e)) from e
+                else:
+                    try:
+                        with gzip.open(fileIn, 'rb') as uncompressedFileIn:
+                            copyfileobj(uncompressedFileIn, fileOut)
+                    except (OSError, EOFError) as e:
+                        raise CacheEntryUnreadableException(
+                            "cached object {} could not be decompressed: {}".format(srcFilePath, e)) from e
+    elif not tryBlockClone(srcFilePath, tempDst):
+        # CopyFileExW copies the bytes in-kernel instead of shuttling them
+        # through Python in 64KB chunks, which covers what CopyFile2 or
+        # sendfile-style helpers would provide. If it fails for some reason,
+        # fall back to the plain Python copy.
+        ret = windll.kernel32.CopyFileExW(str(srcFilePath), str(tempDst), None, None, None, wintypes.DWORD(0))
+        if ret == 0:
+            copyfile(srcFilePath, tempDst)
     os.replace(tempDst, dstFilePath)
 
 
@@ -1009,16 +1381,24 @@ def myExecutablePath():
 
 
 def findCompilerBinary():
-    if "CLCACHE_CL" in os.environ:
-        path = os.environ["CLCACHE_CL"]
+    return findCompilerBinaryImpl(os.environ.get("CLCACHE_CL"),
+                               os.environ.get("PATH", ""),
+                               hasattr(sys, "frozen"))
+
+
+@functools.lru_cache(maxsize=4)
+def findCompilerBinaryImpl(clcacheCl, searchPath, frozenByPy2Exe):
+    # Probing the file system for cl.exe is surprisingly expensive on
+    # Windows, so memoize the lookup on the environment it depends on;
+    # batched /MP invocations repeat it with identical settings.
+    if clcacheCl is not None:
+        path = clcacheCl
         if os.path.basename(path) == path:
             path = which(path)
 
         return path if os.path.exists(path) else None
 
-    frozenByPy2Exe = hasattr(sys, "frozen")
-
-    for p in os.environ["PATH"].split(os.pathsep):
+    for p in searchPath.split(os.pathsep):
         path = os.path.join(p, "cl.exe")
         if os.path.exists(path):
             if not frozenByPy2Exe:
@@ -1030,89 +1410,105 @@ def findCompilerBinary():
     return None
 
 
-def printTraceStatement(msg: str) -> None:
-    if "CLCACHE_LOG" in os.environ:
-        scriptDir = os.path.realpath(os.path.dirname(sys.argv[0]))
-        with OUTPUT_LOCK:
-            print(os.path.join(scriptDir, "clcache.py") + " " + msg)
-
-
-class CommandLineTokenizer:
-    def __init__(self, content):
-        self.argv = []
-        self._content = content
-        self._pos = 0
-        self._token = ''
-        self._parser = self._initialState
-
-        while self._pos < len(self._content):
-            self._parser = self._parser(self._content[self._pos])
-            self._pos += 1
-
-        if self._token:
-            self.argv.append(self._token)
-
-    def _initialState(self, currentChar):
-        if currentChar.isspace():
-            return self._initialState
+# Trace statements are put on a queue and written out in batches by a daemon
+# thread, so that worker threads neither serialize on OUTPUT_LOCK nor pay for
+# a flushing print() call per logged line.
+# The CLCACHE_LOG flag never changes during a run, so snapshot it once
+# instead of consulting os.environ on every call.
+TRACE_ENABLED = "CLCACHE_LOG" in os.environ
+TRACE_QUEUE = None
+TRACE_PREFIX = None
 
-        if currentChar == '"':
-            return self._quotedState
 
-        if currentChar == '\\':
-            self._parseBackslash()
-            return self._unquotedState
+def writeTraceStatements(messages):
+    with OUTPUT_LOCK:
+        print('\n'.join(TRACE_PREFIX + " " + msg for msg in messages))
 
-        self._token += currentChar
-        return self._unquotedState
 
-    def _unquotedState(self, currentChar):
-        if currentChar.isspace():
-            self.argv.append(self._token)
-            self._token = ''
-            return self._initialState
+def drainTraceStatements():
+    while True:
+        messages = [TRACE_QUEUE.get()]
+        while True:
+            try:
+                messages.append(TRACE_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        writeTraceStatements(messages)
 
-        if currentChar == '"':
-            return self._quotedState
 
-        if currentChar == '\\':
-            self._parseBackslash()
-            return self._unquotedState
+def flushTraceStatements():
+    messages = []
+    while True:
+        try:
+            messages.append(TRACE_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    if messages:
+        writeTraceStatements(messages)
 
-        self._token += currentChar
-        return self._unquotedState
 
-    def _quotedState(self, currentChar):
-        if currentChar == '"':
-            return self._unquotedState
+def printTraceStatement(msg: str) -> None:
+    global TRACE_QUEUE, TRACE_PREFIX # pylint: disable=global-statement
+    if not TRACE_ENABLED:
+        return
+    if TRACE_QUEUE is None:
+        with OUTPUT_LOCK:
+            if TRACE_QUEUE is None:
+                scriptDir = os.path.realpath(os.path.dirname(sys.argv[0]))
+                TRACE_PREFIX = os.path.join(scriptDir, "clcache.py")
+                TRACE_QUEUE = queue.SimpleQueue()
+                threading.Thread(target=drainTraceStatements, daemon=True).start()
+                atexit.register(flushTraceStatements)
+    TRACE_QUEUE.put(msg)
 
-        if currentChar == '\\':
-            self._parseBackslash()
-            return self._quotedState
 
-        self._token += currentChar
-        return self._quotedState
+_COMMANDS_FILE_RUN_RE = re.compile(r'\\+|"|\s+|[^\s"\\]+')
 
-    def _parseBackslash(self):
-        numBackslashes = 0
-        while self._pos < len(self._content) and self._content[self._pos] == '\\':
-            self._pos += 1
-            numBackslashes += 1
 
-        followedByDoubleQuote = self._pos < len(self._content) and self._content[self._pos] == '"'
-        if followedByDoubleQuote:
-            self._token += '\\' * (numBackslashes // 2)
-            if numBackslashes % 2 == 0:
-                self._pos -= 1
+def splitCommandsFile(content):
+    # Tokenize according to the MSVC quoting rules. The regex consumes a
+    # whole run of backslashes, whitespace or plain characters per match, so
+    # the Python-level loop runs once per run instead of once per character.
+    argv = []
+    pieces = []
+    haveToken = False
+    inQuotes = False
+    pos = 0
+    contentLength = len(content)
+    while pos < contentLength:
+        match = _COMMANDS_FILE_RUN_RE.match(content, pos)
+        run = match.group()
+        pos = match.end()
+        firstChar = run[0]
+        if firstChar == '\\':
+            numBackslashes = len(run)
+            if pos < contentLength and content[pos] == '"':
+                # Backslash pairs collapse into literal backslashes; an odd
+                # run additionally escapes the quote, an even run leaves it
+                # to be processed as a regular quote character.
+                pieces.append('\\' * (numBackslashes // 2))
+                if numBackslashes % 2:
+                    pieces.append('"')
+                    pos += 1
             else:
-                self._token += '"'
+                pieces.append(run)
+            haveToken = True
+        elif firstChar == '"':
+            inQuotes = not inQuotes
+            haveToken = True
+        elif not inQuotes and firstChar.isspace():
+            if haveToken:
+                argv.append(''.join(pieces))
+                pieces.clear()
+                haveToken = False
         else:
-            self._token += '\\' * numBackslashes
-            self._pos -= 1
-
-
-def splitCommandsFile(content):
-    return CommandLineTokenizer(content).argv
+            pieces.append(run)
+            haveToken = True
+    if haveToken:
+        token = ''.join(pieces)
+        if token:
+            argv.append(token)
+    return argv
 
 
 def expandCommandLine(cmdline):
@@ -1124,23 +1520,18 @@ def expandCommandLine(cmdline):
             with open(includeFile, 'rb') as f:
                 rawBytes = f.read()
 
-            encoding = None
-
-            bomToEncoding = {
-                codecs.BOM_UTF32_BE: 'utf-32-be',
-                codecs.BOM_UTF32_LE: 'utf-32-le',
-                codecs.BOM_UTF16_BE: 'utf-16-be',
-                codecs.BOM_UTF16_LE: 'utf-16-le',
-            }
-
-            for bom, enc in bomToEncoding.items():
-                if rawBytes.startswith(bom):
-                    encoding = enc
-                    rawBytes = rawBytes[len(bom):]
-                    break
-
-            if encoding:
-                includeFileContents = rawBytes.decode(encoding)
+            # Branch on the first bytes directly instead of looping over all
+            # known BOMs. The four byte UTF-32 BOMs must be checked before the
+            # UTF-16 ones since the UTF-16 LE BOM is a prefix of the UTF-32 LE
+            # one.
+            if rawBytes[:4] == codecs.BOM_UTF32_BE:
+                includeFileContents = rawBytes[4:].decode('utf-32-be')
+            elif rawBytes[:4] == codecs.BOM_UTF32_LE:
+                includeFileContents = rawBytes[4:].decode('utf-32-le')
+            elif rawBytes[:2] == codecs.BOM_UTF16_BE:
+                includeFileContents = rawBytes[2:].decode('utf-16-be')
+            elif rawBytes[:2] == codecs.BOM_UTF16_LE:
+                includeFileContents = rawBytes[2:].decode('utf-16-le')
             else:
                 includeFileContents = rawBytes.decode("UTF-8")
 
@@ -1166,6 +1557,21 @@ def extendCommandLineFromEnvironment(cmdLine, environment):
 
 
 class Argument:
+    # Instances are interned: constructing the same argument type with the
+    # same name twice yields the same object. This makes the default identity
+    # based __eq__ and __hash__ sufficient, which is considerably cheaper than
+    # hashing (type, name) tuples on every set lookup.
+    __slots__ = ('name',)
+
+    _instances = {}
+
+    def __new__(cls, name):
+        key = (cls, name)
+        instance = cls._instances.get(key)
+        if instance is None:
+            instance = cls._instances[key] = super().__new__(cls)
+        return instance
+
     def __init__(self, name):
         self.name = name
 
@@ -1175,32 +1581,25 @@ class Argument:
     def __str__(self):
         return "/" + self.name
 
-    def __eq__(self, other):
-        return type(self) == type(other) and self.name == other.name
-
-    def __hash__(self):
-        key = (type(self), self.name)
-        return hash(key)
-
 
 # /NAMEparameter (no space, required parameter).
 class ArgumentT1(Argument):
-    pass
+    __slots__ = ()
 
 
 # /NAME[parameter] (no space, optional parameter)
 class ArgumentT2(Argument):
-    pass
+    __slots__ = ()
 
 
 # /NAME[ ]parameter (optional space)
 class ArgumentT3(Argument):
-    pass
+    __slots__ = ()
 
 
 # /NAME parameter (required space)
 class ArgumentT4(Argument):
-    pass
+    __slots__ = ()
 
 
 class CommandLineAnalyzer:
@@ -1223,13 +1622,20 @@ class CommandLineAnalyzer:
         # /NAME parameter
         ArgumentT4("Xclang"),
     }
-    argumentsWithParameterSorted = sorted(argumentsWithParameter, key=len, reverse=True)
+    # Index the table by the exact flag name. A lookup tries the possible
+    # name lengths from longest to shortest, so prefixes resolve to the
+    # longest known flag (e.g. /FI before /F) with one dict probe per
+    # length instead of a linear scan over the table.
+    argumentsWithParameterByName = {argument.name: argument for argument in argumentsWithParameter}
+    argumentsWithParameterNameLengths = tuple(
+        sorted({len(name) for name in argumentsWithParameterByName}, reverse=True))
 
     @staticmethod
     def _getParameterizedArgumentType(cmdLineArgument):
-        # Sort by length to handle prefixes
-        for arg in CommandLineAnalyzer.argumentsWithParameterSorted:
-            if cmdLineArgument.startswith(arg.name, 1):
+        argumentsByName = CommandLineAnalyzer.argumentsWithParameterByName
+        for nameLength in CommandLineAnalyzer.argumentsWithParameterNameLengths:
+            arg = argumentsByName.get(cmdLineArgument[1:1 + nameLength])
+            if arg is not None:
                 return arg
         return None
 
@@ -1242,7 +1648,7 @@ class CommandLineAnalyzer:
             cmdLineArgument = cmdline[i]
 
             # Plain arguments starting with / or -
-            if cmdLineArgument.startswith('/') or cmdLineArgument.startswith('-'):
+            if cmdLineArgument.startswith(('/', '-')):
                 arg = CommandLineAnalyzer._getParameterizedArgumentType(cmdLineArgument)
                 if arg is not None:
                     if isinstance(arg, ArgumentT1):
@@ -1372,16 +1778,22 @@ def invokeRealCompiler(compilerBinary, cmdLine, captureOutput=False, outputAsStr
 
 # Returns the amount of jobs which should be run in parallel when
 # invoked in batch mode as determined by the /MP argument
-def jobCount(cmdLine):
-    mpSwitches = [arg for arg in cmdLine if re.match(r'^/MP(\d+)?$', arg)]
-    if not mpSwitches:
-        return 1
+_MP_SWITCH_RE = re.compile(r'^/MP(\d+)?$')
 
+def jobCount(cmdLine):
     # the last instance of /MP takes precedence
-    mpSwitch = mpSwitches.pop()
+    mpSwitchSeen = False
+    count = None
+    for arg in cmdLine:
+        match = _MP_SWITCH_RE.match(arg)
+        if match:
+            mpSwitchSeen = True
+            count = match.group(1)
+
+    if not mpSwitchSeen:
+        return 1
 
-    count = mpSwitch[3:]
-    if count != "":
+    if count is not None:
         return int(count)
 
     # /MP, but no count specified; use CPU count
@@ -1506,14 +1918,18 @@ def processCacheHit(cache, objectFile, cachekey):
     printTraceStatement("Reusing cached object for key {} for object file {}".format(cachekey, objectFile))
 
     with cache.lockFor(cachekey):
-        with cache.statistics.lock, cache.statistics as stats:
-            stats.registerCacheHit()
-
         if os.path.exists(objectFile):
             os.remove(objectFile)
 
+        # Restore the object before registering the hit, so that an entry
+        # this process cannot read (CacheEntryUnreadableException) does not
+        # get counted as a hit while the caller recompiles.
         cachedArtifacts = cache.getEntry(cachekey)
         copyOrLink(cachedArtifacts.objectFilePath, objectFile)
+
+        with cache.statistics.lock, cache.statistics as stats:
+            stats.registerCacheHit()
+
         printTraceStatement("Finished. Exit code 0")
         return 0, cachedArtifacts.stdout, cachedArtifacts.stderr, False
 
@@ -1526,7 +1942,7 @@ def createManifestEntry(manifestHash, includePaths):
     includesContentHash = ManifestRepository.getIncludesContentHashForHashes(includeHashes)
     cachekey = CompilerArtifactsRepository.computeKeyDirect(manifestHash, includesContentHash)
 
-    return ManifestEntry(safeIncludes, includesContentHash, cachekey)
+    return ManifestEntry(safeIncludes, sys.intern(includesContentHash), sys.intern(cachekey))
 
 
 def main():
@@ -1752,7 +2168,11 @@ def processDirect(cache, objectFile, compiler, cmdLine, sourceFile):
                         manifestHit = True
                         with cache.lockFor(cachekey):
                             if cache.hasEntry(cachekey):
-                                return processCacheHit(cache, objectFile, cachekey)
+                                try:
+                                    return processCacheHit(cache, objectFile, cachekey)
+                                except CacheEntryUnreadableException as e:
+                                    printTraceStatement("Cached object for key {} is unreadable ({}); "
+                                                        "falling back to the real compiler".format(cachekey, e))
 
                 except IncludeNotFoundException:
                     pass
@@ -1793,7 +2213,11 @@ def processNoDirect(cache, objectFile, compiler, cmdLine, environment):
     cachekey = CompilerArtifactsRepository.computeKeyNodirect(compiler, cmdLine, environment)
     with cache.lockFor(cachekey):
         if cache.hasEntry(cachekey):
-            return processCacheHit(cache, objectFile, cachekey)
+            try:
+                return processCacheHit(cache, objectFile, cachekey)
+            except CacheEntryUnreadableException as e:
+                printTraceStatement("Cached object for key {} is unreadable ({}); "
+                                    "falling back to the real compiler".format(cachekey, e))
 
     compilerResult = invokeRealCompiler(compiler, cmdLine, captureOutput=True, environment=environment)
 
@@ -10,7 +10,8 @@
 # pylint: disable=no-self-use
 #
 from contextlib import contextmanager
-import multiprocessing
+import io
+import itertools
 import os
 import unittest
 import tempfile
@@ -38,22 +39,30 @@ from clcache.__main__ import (
 )
 from clcache.storage import CacheMemcacheStrategy
 
-ASSETS_DIR = os.path.join(os.path.dirname(__file__), "unittests")
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "unittests")
 
 
 @contextmanager
 def cd(targetDirectory):
     oldDirectory = os.getcwd()
-    os.chdir(os.path.expanduser(targetDirectory))
+    if '~' in targetDirectory:
+        targetDirectory = os.path.expanduser(targetDirectory)
+    os.chdir(targetDirectory)
     try:
         yield
     finally:
         os.chdir(oldDirectory)
 
 
+TEMPORARY_FILE_COUNTER = itertools.count()
+
+
 def temporaryFileName():
-    with tempfile.NamedTemporaryFile() as f:
-        return f.name
+    # The callers only need a path that does not exist yet; creating and
+    # deleting a NamedTemporaryFile just to learn its name costs two extra
+    # syscalls per call. The pid keeps paths unique across xdist workers.
+    return os.path.join(tempfile.gettempdir(),
+                        "clcache-test-{}-{}".format(os.getpid(), next(TEMPORARY_FILE_COUNTER)))
 
 
 class TestHelperFunctions(unittest.TestCase):
@@ -226,13 +235,16 @@ class TestManifestRepository(unittest.TestCase):
     manifest2 = Manifest([entry2])
 
     def _getDirectorySize(self, dirPath):
-        def filesize(path, filename):
-            return os.stat(os.path.join(path, filename)).st_size
-
+        # scandir-based so that each entry's size comes from the directory
+        # enumeration instead of a separate os.stat call per file.
         size = 0
-        for path, _, filenames in clcache.WALK(dirPath):
-            size += sum(filesize(path, f) for f in filenames)
-
+        directories = [dirPath]
+        while directories:
+            for entry in os.scandir(directories.pop()):
+                if entry.is_dir():
+                    directories.append(entry.path)
+                else:
+                    size += entry.stat().st_size
         return size
 
     def testPaths(self):
@@ -514,6 +526,60 @@ class TestFilterSourceFiles(unittest.TestCase):
             ['/c', '/EP', '/FoSome.obj'])
 
 
+# Data table for testParseArgumentsAndInputFiles. The irregular cases are
+# spelled out; the per-flag cases for the three implemented argument types
+# are generated from the flag lists since they only differ in the flag name.
+PARSE_ARGUMENTS_CASES = [
+    (['/c', 'main.cpp'],
+     {'c': ['']},
+     ['main.cpp']),
+    (['/link', 'unit1.obj', 'unit2.obj'],
+     {'link': ['']},
+     ['unit1.obj', 'unit2.obj']),
+    (['/Fooutfile.obj', 'main.cpp'],
+     {'Fo': ['outfile.obj']},
+     ['main.cpp']),
+    (['/Fo', '/Fooutfile.obj', 'main.cpp'],
+     {'Fo': ['', 'outfile.obj']},
+     ['main.cpp']),
+    (['/c', '/I', 'somedir', 'main.cpp'],
+     {'c': [''], 'I': ['somedir']},
+     ['main.cpp']),
+    (['/c', '/I.', '/I', 'somedir', 'main.cpp'],
+     {'c': [''], 'I': ['.', 'somedir']},
+     ['main.cpp']),
+]
+
+# Type 1 (/NAMEparameter) - Arguments with required parameter
+for _flag in ['Ob', 'Yl', 'Zm']:
+    PARSE_ARGUMENTS_CASES.append(
+        (['/c', '/' + _flag + '99', 'main.cpp'], {'c': [''], _flag: ['99']}, ['main.cpp']))
+
+# Type 2 (/NAME[parameter]) - Optional argument parameters
+for _flag in ['doc', 'FA', 'Fr', 'FR', 'Gs', 'MP', 'Wv', 'Yc', 'Yu', 'Zp',
+              'Fa', 'Fd', 'Fe', 'Fi', 'Fm', 'Fo', 'Fp']:
+    # get parameter=99
+    PARSE_ARGUMENTS_CASES.append(
+        (['/c', '/' + _flag + '99', 'main.cpp'], {'c': [''], _flag: ['99']}, ['main.cpp']))
+    # get no parameter
+    PARSE_ARGUMENTS_CASES.append(
+        (['/c', '/' + _flag, 'main.cpp'], {'c': [''], _flag: ['']}, ['main.cpp']))
+
+# Type 3 (/NAME[ ]parameter) - Required argument parameters with optional space
+for _flag in ['FI', 'U', 'I', 'F', 'FU', 'w1', 'w2', 'w3', 'w4', 'wd', 'we',
+              'wo', 'AI', 'D', 'V', 'Tc', 'Tp']:
+    # get space
+    PARSE_ARGUMENTS_CASES.append(
+        (['/c', '/' + _flag, '99', 'main.cpp'], {'c': [''], _flag: ['99']}, ['main.cpp']))
+    # don't get space
+    PARSE_ARGUMENTS_CASES.append(
+        (['/c', '/' + _flag + '99', 'main.cpp'], {'c': [''], _flag: ['99']}, ['main.cpp']))
+
+# Type 4 (/NAME parameter) - Forced space
+# Some documented, but non implemented
+del _flag
+
+
 class TestAnalyzeCommandLine(unittest.TestCase):
     def _testSourceFilesOk(self, cmdLine):
         try:
@@ -527,13 +593,13 @@ class TestAnalyzeCommandLine(unittest.TestCase):
                 pass
 
     def _testFailure(self, cmdLine, expectedExceptionClass):
-        self.assertRaises(expectedExceptionClass, lambda: CommandLineAnalyzer.analyze(cmdLine))
+        self.assertRaises(expectedExceptionClass, CommandLineAnalyzer.analyze, cmdLine)
 
     def _testFull(self, cmdLine, expectedSourceFiles, expectedOutputFile):
         # type: (List[str], List[Tuple[str, str]], List[str]) -> None
         sourceFiles, outputFile = CommandLineAnalyzer.analyze(cmdLine)
-        self.assertEqual(sourceFiles, expectedSourceFiles)
-        self.assertEqual(outputFile, expectedOutputFile)
+        self.assertListEqual(sourceFiles, expectedSourceFiles)
+        self.assertListEqual(outputFile, expectedOutputFile)
 
     def _testFo(self, foArgument, expectedObjectFilepath):
         self._testFull(['/c', foArgument, 'main.cpp'],
@@ -548,8 +614,8 @@ class TestAnalyzeCommandLine(unittest.TestCase):
 
     def _testArgInfiles(self, cmdLine, expectedArguments, expectedInputFiles):
         arguments, inputFiles = CommandLineAnalyzer.parseArgumentsAndInputFiles(cmdLine)
-        self.assertEqual(arguments, expectedArguments)
-        self.assertEqual(inputFiles, expectedInputFiles)
+        self.assertDictEqual(arguments, expectedArguments)
+        self.assertListEqual(inputFiles, expectedInputFiles)
 
     def testEmpty(self):
         self._testFailure([], NoSourceFileError)
@@ -748,113 +814,13 @@ class TestAnalyzeCommandLine(unittest.TestCase):
         self._testSourceFilesOk(["/c", "/FU999", "main.cpp"])
 
     def testParseArgumentsAndInputFiles(self):
-        self._testArgInfiles(['/c', 'main.cpp'],
-                             {'c': ['']},
-                             ['main.cpp'])
-        self._testArgInfiles(['/link', 'unit1.obj', 'unit2.obj'],
-                             {'link': ['']},
-                             ['unit1.obj', 'unit2.obj'])
-        self._testArgInfiles(['/Fooutfile.obj', 'main.cpp'],
-                             {'Fo': ['outfile.obj']},
-                             ['main.cpp'])
-        self._testArgInfiles(['/Fo', '/Fooutfile.obj', 'main.cpp'],
-                             {'Fo': ['', 'outfile.obj']},
-                             ['main.cpp'])
-        self._testArgInfiles(['/c', '/I', 'somedir', 'main.cpp'],
-                             {'c': [''], 'I': ['somedir']},
-                             ['main.cpp'])
-        self._testArgInfiles(['/c', '/I.', '/I', 'somedir', 'main.cpp'],
-                             {'c': [''], 'I': ['.', 'somedir']},
-                             ['main.cpp'])
-
-        # Type 1 (/NAMEparameter) - Arguments with required parameter
-        # get parameter=99
-        self._testArgInfiles(["/c", "/Ob99", "main.cpp"], {'c': [''], 'Ob': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Yl99", "main.cpp"], {'c': [''], 'Yl': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Zm99", "main.cpp"], {'c': [''], 'Zm': ['99']}, ['main.cpp'])
-
-        # # Type 2 (/NAME[parameter]) - Optional argument parameters
-        # get parameter=99
-        self._testArgInfiles(["/c", "/doc99", "main.cpp"], {'c': [''], 'doc': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/FA99", "main.cpp"], {'c': [''], 'FA': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fr99", "main.cpp"], {'c': [''], 'Fr': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/FR99", "main.cpp"], {'c': [''], 'FR': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Gs99", "main.cpp"], {'c': [''], 'Gs': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/MP99", "main.cpp"], {'c': [''], 'MP': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Wv99", "main.cpp"], {'c': [''], 'Wv': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Yc99", "main.cpp"], {'c': [''], 'Yc': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Yu99", "main.cpp"], {'c': [''], 'Yu': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Zp99", "main.cpp"], {'c': [''], 'Zp': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fa99", "main.cpp"], {'c': [''], 'Fa': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fd99", "main.cpp"], {'c': [''], 'Fd': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fe99", "main.cpp"], {'c': [''], 'Fe': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fi99", "main.cpp"], {'c': [''], 'Fi': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fm99", "main.cpp"], {'c': [''], 'Fm': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fo99", "main.cpp"], {'c': [''], 'Fo': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fp99", "main.cpp"], {'c': [''], 'Fp': ['99']}, ['main.cpp'])
-        # get no parameter
-        self._testArgInfiles(["/c", "/doc", "main.cpp"], {'c': [''], 'doc': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/FA", "main.cpp"], {'c': [''], 'FA': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fr", "main.cpp"], {'c': [''], 'Fr': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/FR", "main.cpp"], {'c': [''], 'FR': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Gs", "main.cpp"], {'c': [''], 'Gs': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/MP", "main.cpp"], {'c': [''], 'MP': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Wv", "main.cpp"], {'c': [''], 'Wv': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Yc", "main.cpp"], {'c': [''], 'Yc': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Yu", "main.cpp"], {'c': [''], 'Yu': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Zp", "main.cpp"], {'c': [''], 'Zp': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fa", "main.cpp"], {'c': [''], 'Fa': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fd", "main.cpp"], {'c': [''], 'Fd': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fe", "main.cpp"], {'c': [''], 'Fe': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fi", "main.cpp"], {'c': [''], 'Fi': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fm", "main.cpp"], {'c': [''], 'Fm': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fo", "main.cpp"], {'c': [''], 'Fo': ['']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Fp", "main.cpp"], {'c': [''], 'Fp': ['']}, ['main.cpp'])
-
-        # Type 3 (/NAME[ ]parameter) - Required argument parameters with optional space
-        # get space
-        self._testArgInfiles(["/c", "/FI", "99", "main.cpp"], {'c': [''], 'FI': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/U", "99", "main.cpp"], {'c': [''], 'U': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/I", "99", "main.cpp"], {'c': [''], 'I': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/F", "99", "main.cpp"], {'c': [''], 'F': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/FU", "99", "main.cpp"], {'c': [''], 'FU': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w1", "99", "main.cpp"], {'c': [''], 'w1': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w2", "99", "main.cpp"], {'c': [''], 'w2': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w3", "99", "main.cpp"], {'c': [''], 'w3': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w4", "99", "main.cpp"], {'c': [''], 'w4': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/wd", "99", "main.cpp"], {'c': [''], 'wd': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/we", "99", "main.cpp"], {'c': [''], 'we': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/wo", "99", "main.cpp"], {'c': [''], 'wo': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/AI", "99", "main.cpp"], {'c': [''], 'AI': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/D", "99", "main.cpp"], {'c': [''], 'D': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/V", "99", "main.cpp"], {'c': [''], 'V': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Tc", "99", "main.cpp"], {'c': [''], 'Tc': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Tp", "99", "main.cpp"], {'c': [''], 'Tp': ['99']}, ['main.cpp'])
-        # don't get space
-        self._testArgInfiles(["/c", "/FI99", "main.cpp"], {'c': [''], 'FI': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/U99", "main.cpp"], {'c': [''], 'U': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/I99", "main.cpp"], {'c': [''], 'I': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/F99", "main.cpp"], {'c': [''], 'F': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/FU99", "main.cpp"], {'c': [''], 'FU': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w199", "main.cpp"], {'c': [''], 'w1': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w299", "main.cpp"], {'c': [''], 'w2': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w399", "main.cpp"], {'c': [''], 'w3': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/w499", "main.cpp"], {'c': [''], 'w4': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/wd99", "main.cpp"], {'c': [''], 'wd': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/we99", "main.cpp"], {'c': [''], 'we': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/wo99", "main.cpp"], {'c': [''], 'wo': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/AI99", "main.cpp"], {'c': [''], 'AI': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/D99", "main.cpp"], {'c': [''], 'D': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/V99", "main.cpp"], {'c': [''], 'V': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Tc99", "main.cpp"], {'c': [''], 'Tc': ['99']}, ['main.cpp'])
-        self._testArgInfiles(["/c", "/Tp99", "main.cpp"], {'c': [''], 'Tp': ['99']}, ['main.cpp'])
-
-        # Type 4 (/NAME parameter) - Forced space
-        # Some documented, but non implemented
+        for cmdLine, expectedArguments, expectedInputFiles in PARSE_ARGUMENTS_CASES:
+            with self.subTest(cmdLine=cmdLine):
+                self._testArgInfiles(cmdLine, expectedArguments, expectedInputFiles)
 
 
 class TestMultipleSourceFiles(unittest.TestCase):
-    CPU_CORES = multiprocessing.cpu_count()
+    CPU_CORES = os.cpu_count() or 1
 
     def testCpuCuresPlausibility(self):
         # 1 <= CPU_CORES <= 32
@@ -1139,14 +1105,28 @@ class TestCompression(unittest.TestCase):
             size = os.path.getsize(dstFilePath)
             self.assertEqual(size, expectedSize)
 
+    @staticmethod
+    def expectedCompressedSize(level=None):
+        # copyOrLink compresses with zstandard when it is installed and
+        # falls back to gzip otherwise, so compute the expected size with
+        # the same compressor.
+        data = b"".join(b"%d" % i for i in range(0, 999))
+        try:
+            import zstandard
+            fileIn, fileOut = io.BytesIO(data), io.BytesIO()
+            zstandard.ZstdCompressor(level=level if level is not None else 3).copy_stream(fileIn, fileOut)
+            return len(fileOut.getvalue())
+        except ImportError:
+            return {None: 1481, 1: 1536}[level]
+
     def testCompression(self):
         os.environ["CLCACHE_COMPRESS"] = "1"
-        self.assertEntrySizeIsCorrect(1481)
+        self.assertEntrySizeIsCorrect(self.expectedCompressedSize())
 
     def testCompressionLevel(self):
         os.environ["CLCACHE_COMPRESS"] = "1"
         os.environ["CLCACHE_COMPRESSLEVEL"] = "1"
-        self.assertEntrySizeIsCorrect(1536)
+        self.assertEntrySizeIsCorrect(self.expectedCompressedSize(1))
 
     def testNoCompression(self):
         self.assertEntrySizeIsCorrect(2887)